@@ -1,6 +1,6 @@
 # ---
 # Keystroke Dynamics & Stress Analysis
-# Install: pip install pandas numpy scipy matplotlib seaborn
+# Install: pip install pandas numpy scipy matplotlib seaborn (optional: numba, speeds up CHUNK 1)
 #
 # HOW TO RUN (as participants grow, use separate cells and run only what you need):
 #   CHUNK 1: Load data + compute metrics (always run first) → produces keystrokes, stress, metrics_df
@@ -11,11 +11,19 @@
 #   CHUNK 6: Overall stats (by test_type: p10, mean, p90)
 # ---
 
+import hashlib
 import os
+import types
 import pandas as pd
 import numpy as np
 from scipy import stats
 
+# Optional: numba JIT-compiles the KHD/IKI scan; without it the NumPy fallback is used
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
 # Limit how many sessions to print in Individual stats (Section 5). Set to None to print all.
 MAX_SESSIONS_TO_PRINT = 20
 
@@ -25,8 +33,27 @@ MAX_SESSIONS_TO_PRINT = 20
 # Paths to your CSV files (Deepnote: files are often under /work/)
 KEYSTROKES_FILE = "./keystrokes.csv"
 STRESS_FILE = "./stress_workload.csv"
+# CHUNK 1 metrics are cached here and reused while the keystrokes frame's contents and the metric code
+# are unchanged (needs pyarrow or fastparquet; without one, metrics are just recomputed). Delete the
+# files to force a recompute.
+METRICS_CACHE_FILE = "./.metrics_cache.parquet"
+PER_FIELD_METRICS_CACHE_FILE = "./.per_field_metrics_cache.parquet"
+
+# Only the keystroke columns the analysis uses (matched case-insensitively, as normalized below)
+KEYSTROKE_COLUMNS = {"session_id", "test_type", "event_type", "key", "pressed_at", "timestamp", "field_name"}
+
+
+def read_csv_columns(path, columns):
+    """read_csv of just `columns`, with the multithreaded pyarrow parser when it is installed."""
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in header if c.strip().lower() in columns]
+    try:
+        return pd.read_csv(path, usecols=usecols, engine="pyarrow")
+    except ImportError:
+        return pd.read_csv(path, usecols=usecols)
+
 
-keystrokes = pd.read_csv(KEYSTROKES_FILE)
+keystrokes = read_csv_columns(KEYSTROKES_FILE, KEYSTROKE_COLUMNS)
 stress = pd.read_csv(STRESS_FILE)
 
 
@@ -34,15 +61,25 @@ stress = pd.read_csv(STRESS_FILE)
 keystrokes.columns = [c.strip().lower() for c in keystrokes.columns]
 stress.columns = [c.strip().lower() for c in stress.columns]
 
-# Use correct timestamp column (your DB: pressed_at); handle mixed formats like your first code
+# Use correct timestamp column (your DB: pressed_at). Supabase exports ISO-8601, which parses in one
+# vectorized pass; per-row format="mixed" inference is only the fallback for other formats.
 ts_col = "pressed_at" if "pressed_at" in keystrokes.columns else "timestamp"
-keystrokes["pressed_at"] = pd.to_datetime(keystrokes[ts_col], format="mixed")
+try:
+    keystrokes["pressed_at"] = pd.to_datetime(keystrokes[ts_col], format="ISO8601", utc=True)
+except ValueError:
+    keystrokes["pressed_at"] = pd.to_datetime(keystrokes[ts_col], format="mixed", utc=True)
+# Epoch ms, computed once for both metrics functions: a datetime64 cast + view, no int64 round-trip copy
+keystrokes["pressed_at_ms"] = keystrokes["pressed_at"].values.astype("datetime64[ms]").view("i8")
 
 # Required: session_id, test_type, event_type, key
 for col in ["session_id", "test_type", "event_type", "key"]:
     if col not in keystrokes.columns:
         raise ValueError(f"keystrokes must have column '{col}'")
 
+# Repeated string columns as category: comparisons and groupbys then work on int codes
+for col in ["session_id", "event_type", "key"]:
+    keystrokes[col] = keystrokes[col].astype("category")
+
 print("Keystrokes columns:", keystrokes.columns.tolist())
 print("Stress columns:", stress.columns.tolist())
 print("Loaded", len(keystrokes), "keystroke rows,", len(stress), "stress rows.")
@@ -52,33 +89,269 @@ print("Loaded", len(keystrokes), "keystroke rows,", len(stress), "stress rows.")
 # CHUNK 1 (continued): KEYSTROKE METRICS (per session × test_type, plus overall per session)
 # =============================================================================
 
-def _agg_row(sid, tt, grp, khd_s, iki_s):
-    """Build one aggregate row for a group (used for per-test and per-session overall)."""
-    times = grp['pressed_at_ms'].values
-    duration_ms = times.max() - times.min() if len(times) >= 2 else 0
-    n_events = len(grp)
-    n_keydowns = (grp['event_type'] == 'keydown').sum()
-    n_backspace = ((grp['event_type'] == 'keydown') & (grp['key'] == 'Backspace')).sum()
-    pause_200 = (iki_s > 200).sum() if len(iki_s) else 0
-    pause_500 = (iki_s > 500).sum() if len(iki_s) else 0
-    return {
-        'session_id': sid,
-        'test_type': tt,
-        'n_events': n_events,
-        'n_keydowns': n_keydowns,
-        'duration_sec': duration_ms / 1000.0,
-        'mean_khd_ms': khd_s.mean() if len(khd_s) else np.nan,
-        'sd_khd_ms': khd_s.std() if len(khd_s) else np.nan,
-        'cv_khd': khd_s.std() / khd_s.mean() if len(khd_s) and khd_s.mean() > 0 else np.nan,
-        'mean_iki_ms': iki_s.mean() if len(iki_s) else np.nan,
-        'sd_iki_ms': iki_s.std() if len(iki_s) else np.nan,
-        'cv_iki': iki_s.std() / iki_s.mean() if len(iki_s) and iki_s.mean() > 0 else np.nan,
-        'pause_count_200ms': pause_200,
-        'pause_count_500ms': pause_500,
-        'backspace_count': n_backspace,
-        'backspace_rate': n_backspace / n_keydowns if n_keydowns else 0,
-        'cpm': (n_keydowns - n_backspace) / (duration_ms / 60000) if duration_ms > 0 else np.nan,
-    }
+def _group_stats(values, labels, n_groups, ddof):
+    """Per-label mean and SD of values via bincount (NaN where a label has too few values)."""
+    count = np.bincount(labels, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(labels, weights=values, minlength=n_groups) / count
+        dev = values - mean[labels]
+        sd = np.sqrt(np.bincount(labels, weights=dev * dev, minlength=n_groups) / (count - ddof))
+    sd[count <= ddof] = np.nan
+    return mean, sd
+
+
+def _group_events(df, keys=('session_id', 'test_type')):
+    """
+    Per-group event totals of a _scan_by frame (sorted, with group_id/evt_code columns): the
+    `keys` read from each group's first row plus n_events, n_keydowns, backspace_count, t_min,
+    t_max and, if df has a test_start_ms column, test_start_ms. Reductions are bincount/reduceat.
+    """
+    labels = df['group_id'].values
+    starts = np.flatnonzero(np.diff(labels, prepend=-1))
+    n_groups = len(starts)
+    times = df['pressed_at_ms'].values
+    is_keydown = df['evt_code'].values == 0
+    is_backspace = is_keydown & (df['key'].values == 'Backspace')
+    events = {k: df[k].values[starts].astype(object) for k in keys}
+    events['n_events'] = np.diff(np.append(starts, len(labels)))
+    events['n_keydowns'] = np.bincount(labels[is_keydown], minlength=n_groups)
+    events['backspace_count'] = np.bincount(labels[is_backspace], minlength=n_groups)
+    events['t_min'] = np.minimum.reduceat(times, starts)
+    events['t_max'] = np.maximum.reduceat(times, starts)
+    if 'test_start_ms' in df.columns:
+        events['test_start_ms'] = np.minimum.reduceat(df['test_start_ms'].values, starts)
+    return pd.DataFrame(events)
+
+
+def _summarize_groups(events, khd_df, iki_df, keys=('session_id', 'test_type'), ddof=1):
+    """
+    Metric columns for each row of `events` (from _group_events, or a roll-up of it); the
+    group_id of khd_df/iki_df is the row position in `events`. KHD/IKI reductions are bincount
+    over NumPy arrays and `ddof` is used for the SDs. If events has test_start_ms,
+    first_key_latency_ms (group's first event minus the test start) is added too.
+    Returns a dict of typed column arrays (int32 counts, float64 stats) for one
+    pd.DataFrame call, so callers can stack several results without a concat.
+    """
+    n_groups = len(events)
+    n_keydowns = events['n_keydowns'].values
+    n_backspace = events['backspace_count'].values
+    duration_ms = events['t_max'].values - events['t_min'].values
+
+    khd = khd_df['khd_ms'].values
+    iki = iki_df['iki_ms'].values
+    iki_labels = iki_df['group_id'].values
+    mean_khd, sd_khd = _group_stats(khd, khd_df['group_id'].values, n_groups, ddof)
+    mean_iki, sd_iki = _group_stats(iki, iki_labels, n_groups, ddof)
+
+    columns = {k: events[k].values.astype(object) for k in keys}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns.update({
+            'n_events': events['n_events'].values.astype(np.int32),
+            'n_keydowns': n_keydowns.astype(np.int32),
+            'duration_sec': duration_ms / 1000.0,
+            'mean_khd_ms': mean_khd,
+            'sd_khd_ms': sd_khd,
+            'cv_khd': np.where(mean_khd > 0, sd_khd / mean_khd, np.nan),
+            'mean_iki_ms': mean_iki,
+            'sd_iki_ms': sd_iki,
+            'cv_iki': np.where(mean_iki > 0, sd_iki / mean_iki, np.nan),
+            'pause_count_200ms': np.bincount(iki_labels[iki > 200], minlength=n_groups).astype(np.int32),
+            'pause_count_500ms': np.bincount(iki_labels[iki > 500], minlength=n_groups).astype(np.int32),
+            'backspace_count': n_backspace.astype(np.int32),
+            'backspace_rate': np.where(n_keydowns > 0, n_backspace / n_keydowns, 0.0),
+            'cpm': np.where(duration_ms > 0, (n_keydowns - n_backspace) / (duration_ms / 60000), np.nan),
+        })
+    if 'test_start_ms' in events.columns:
+        columns['first_key_latency_ms'] = events['t_min'].values - events['test_start_ms'].values
+    return columns
+
+
+def _group_starts(df, cols):
+    """
+    Start offset of each run of equal `cols` values in a sorted frame, plus a final len(df).
+    `cols` must be categorical; their int codes are used instead of comparing values.
+    """
+    codes = [df[c].cat.codes.values.astype(np.int64) + 1 for c in cols]
+    group_key = np.ravel_multi_index(codes, [len(df[c].cat.categories) + 1 for c in cols])
+    starts = np.flatnonzero(np.diff(group_key, prepend=-1))
+    return np.append(starts, len(df))
+
+
+def _event_arrays(df):
+    """
+    Struct-of-arrays view of the events the scans need, built once per frame:
+    int64 ms timestamps, int16 key codes (-1 = missing; int32 if there are too many keys)
+    and int8 event types (0 = keydown, 1 = keyup, -1 = other).
+    Key and event type are read from their category codes, so no strings are compared per row.
+    """
+    times = df['pressed_at_ms'].values.astype(np.int64, copy=False)
+    keys = df['key'].astype('category').cat
+    key_dtype = np.int16 if len(keys.categories) < np.iinfo(np.int16).max else np.int32
+    evts = df['event_type'].astype('category').cat
+    # Category code -> event code; the extra last slot catches code -1 (missing)
+    evt_lookup = np.full(len(evts.categories) + 1, -1, dtype=np.int8)
+    for evt_code, name in enumerate(['keydown', 'keyup']):
+        if name in evts.categories:
+            evt_lookup[evts.categories.get_loc(name)] = evt_code
+    return times, keys.codes.values.astype(key_dtype), evt_lookup[evts.codes.values]
+
+
+def _khd_pairs(times, codes, evts):
+    """
+    Key hold durations for one time-sorted group of events.
+    Each keydown is paired with the next keyup of the same key, unless another keydown of
+    that key comes first. Returns khd_ms for holds in (0, 2000) ms.
+    """
+    # Keydown/keyup positions grouped by key (stable, so still in time order within a key):
+    # the next event of the same key is then simply the next entry
+    idx = np.flatnonzero((evts >= 0) & (codes >= 0))
+    order = idx[np.argsort(codes[idx], kind='stable')]
+    key = codes[order]
+    evt = evts[order]
+    paired = (evt[:-1] == 0) & (evt[1:] == 1) & (key[:-1] == key[1:])
+    khd = times[order[1:][paired]] - times[order[:-1][paired]]
+    return khd[(0 < khd) & (khd < 2000)]
+
+
+def _iki_pairs(times, evts):
+    """
+    Inter-key intervals for one time-sorted group of events.
+    A keydown gets an IKI only when the previous keydown/keyup event is a keyup, i.e. each
+    keyup is used at most once. Returns iki_ms for gaps in (0, 5000) ms.
+    """
+    idx = np.flatnonzero(evts >= 0)
+    ev = evts[idx]
+    paired = (ev[1:] == 0) & (ev[:-1] == 1)
+    iki = times[idx[1:][paired]] - times[idx[:-1][paired]]
+    return iki[(0 < iki) & (iki < 5000)]
+
+
+def _scan_groups_numpy(group_starts, times, codes, evts):
+    """NumPy fallback for _scan_groups (same outputs, used when numba is not installed)."""
+    n_groups = len(group_starts) - 1
+    khd_parts, iki_parts = [], []
+    khd_off = np.zeros(n_groups + 1, dtype=np.int64)
+    iki_off = np.zeros(n_groups + 1, dtype=np.int64)
+    for g in range(n_groups):
+        s, e = group_starts[g], group_starts[g + 1]
+        khd = _khd_pairs(times[s:e], codes[s:e], evts[s:e])
+        khd_parts.append(khd)
+        khd_off[g + 1] = khd_off[g] + len(khd)
+
+        iki = _iki_pairs(times[s:e], evts[s:e])
+        iki_parts.append(iki)
+        iki_off[g + 1] = iki_off[g] + len(iki)
+    empty = [np.empty(0, dtype=np.int64)]
+    return np.concatenate(khd_parts + empty), khd_off, np.concatenate(iki_parts + empty), iki_off
+
+
+def _scan_group(s, e, times, codes, evts, n_keys, khd_out, iki_out, k, n, fill):
+    """
+    Paired KHD/IKI scan over events[s:e] (same rules as _khd_pairs and _iki_pairs).
+    Returns the (khd, iki) counts; when `fill`, also writes them from khd_out[k] / iki_out[n].
+    """
+    # next_same[i - s]: position of the next keydown/keyup of the same key (-1 if none), built
+    # in one backward pass so each keydown finds its candidate keyup in O(1)
+    next_same = np.full(e - s, -1, dtype=np.int64)
+    last_seen = np.full(n_keys, -1, dtype=np.int64)
+    for i in range(e - 1, s - 1, -1):
+        if evts[i] >= 0 and codes[i] >= 0:
+            next_same[i - s] = last_seen[codes[i]]
+            last_seen[codes[i]] = i
+    n_khd = 0
+    for i in range(s, e):
+        j = next_same[i - s]
+        if evts[i] == 0 and j >= 0 and evts[j] == 1:
+            khd_ms = times[j] - times[i]
+            if 0 < khd_ms < 2000:
+                if fill:
+                    khd_out[k + n_khd] = khd_ms
+                n_khd += 1
+    n_iki = 0
+    has_keyup = False
+    last_keyup_time = 0
+    for i in range(s, e):
+        if evts[i] == 1:
+            last_keyup_time = times[i]
+            has_keyup = True
+        elif evts[i] == 0 and has_keyup:
+            iki_ms = times[i] - last_keyup_time
+            if 0 < iki_ms < 5000:
+                if fill:
+                    iki_out[n + n_iki] = iki_ms
+                n_iki += 1
+            has_keyup = False
+    return n_khd, n_iki
+
+
+def _scan_groups(group_starts, times, codes, evts):
+    """
+    KHD/IKI for every group in one call. Two passes over the groups: the first counts outputs
+    to size the buffers, the second fills them, so groups can be scanned in parallel.
+    Returns (khd_ms, khd offsets, iki_ms, iki offsets); group g owns
+    khd_ms[khd_off[g]:khd_off[g + 1]] and likewise for IKI.
+    """
+    n_groups = len(group_starts) - 1
+    n_keys = codes.max() + 1 if len(codes) else 0
+    n_khd = np.zeros(n_groups, dtype=np.int64)
+    n_iki = np.zeros(n_groups, dtype=np.int64)
+    empty = np.empty(0, dtype=np.int64)
+    for g in prange(n_groups):
+        c_khd, c_iki = _scan_group(group_starts[g], group_starts[g + 1], times, codes, evts, n_keys,
+                                   empty, empty, 0, 0, False)
+        n_khd[g] = c_khd
+        n_iki[g] = c_iki
+    khd_off = np.zeros(n_groups + 1, dtype=np.int64)
+    iki_off = np.zeros(n_groups + 1, dtype=np.int64)
+    khd_off[1:] = np.cumsum(n_khd)
+    iki_off[1:] = np.cumsum(n_iki)
+    khd_out = np.empty(khd_off[-1], dtype=np.int64)
+    iki_out = np.empty(iki_off[-1], dtype=np.int64)
+    for g in prange(n_groups):
+        _scan_group(group_starts[g], group_starts[g + 1], times, codes, evts, n_keys,
+                    khd_out, iki_out, khd_off[g], iki_off[g], True)
+    return khd_out, khd_off, iki_out, iki_off
+
+
+def _jit(func, **options):
+    """njit with an on-disk cache; without a source file to cache against (e.g. exec'd code), no cache."""
+    try:
+        return njit(cache=True, **options)(func)
+    except RuntimeError:
+        return njit(**options)(func)
+
+
+if njit is not None:
+    _scan_group = _jit(_scan_group)
+    _scan_groups = _jit(_scan_groups, parallel=True)
+else:
+    _scan_groups = _scan_groups_numpy
+
+
+def _scan_by(df, group_cols):
+    """
+    Sort df into one contiguous slice per `group_cols` group and run the KHD/IKI scan once.
+    Returns (sorted df, khd_df, iki_df). Rows with a missing group value are dropped, the group
+    columns become categorical and df gains group_id (0..n-1 in sorted order) and evt_code
+    columns; khd_df/iki_df carry the group_id of the slice each value came from.
+    """
+    group_cols = list(group_cols)
+    df = df.dropna(subset=group_cols).sort_values(group_cols + ['pressed_at']).reset_index(drop=True)
+    df[group_cols] = df[group_cols].astype('category')
+    times, key_codes, evt_codes = _event_arrays(df)
+    group_starts = _group_starts(df, group_cols)
+    khd_vals, khd_off, iki_vals, iki_off = _scan_groups(group_starts, times, key_codes, evt_codes)
+
+    group_ids = np.arange(len(group_starts) - 1)
+    df['group_id'] = group_ids.repeat(np.diff(group_starts))
+    df['evt_code'] = evt_codes
+    khd_df = pd.DataFrame({'group_id': group_ids.repeat(np.diff(khd_off)), 'khd_ms': khd_vals})
+    iki_df = pd.DataFrame({'group_id': group_ids.repeat(np.diff(iki_off)), 'iki_ms': iki_vals})
+    return df, khd_df, iki_df
+
+
+# Placeholder test_type for events without one (see compute_keystroke_metrics)
+_NO_TEST_TYPE = '<no test_type>'
 
 
 def compute_keystroke_metrics(df: pd.DataFrame) -> pd.DataFrame:
@@ -86,110 +359,38 @@ def compute_keystroke_metrics(df: pd.DataFrame) -> pd.DataFrame:
     Compute key hold duration (KHD), inter-key interval (IKI), pauses, and derived stats.
     Returns metrics (1) by session_id and test_type (free, timed, multitasking) and
     (2) by session_id with test_type='overall' (all tests in that session combined).
+    KHD/IKI pairs are found within a test only; 'overall' pools those per-test values.
+    Events with no test_type count towards 'overall' only.
     df must have: session_id, test_type, pressed_at, event_type, key.
     """
-    df = df.sort_values(['session_id', 'test_type', 'pressed_at']).reset_index(drop=True)
-    df['pressed_at_ms'] = df['pressed_at'].astype(np.int64) // 10**6
-
-    khd_list = []
-    session_test = []
-    key_list = []
-
-    for (sid, tt), grp in df.groupby(['session_id', 'test_type']):
-        grp = grp.sort_values('pressed_at').reset_index(drop=True)
-        keys = grp['key'].values
-        times = grp['pressed_at_ms'].values
-        evts = grp['event_type'].values
-        i = 0
-        while i < len(grp) - 1:
-            if evts[i] == 'keydown':
-                key = keys[i]
-                t_down = times[i]
-                j = i + 1
-                while j < len(grp):
-                    if evts[j] == 'keyup' and keys[j] == key:
-                        khd_ms = times[j] - t_down
-                        if 0 < khd_ms < 2000:
-                            khd_list.append(khd_ms)
-                            session_test.append((sid, tt))
-                            key_list.append(key)
-                        break
-                    if evts[j] == 'keydown' and keys[j] == key:
-                        break
-                    j += 1
-            i += 1
-
-    iki_list = []
-    for (sid, tt), grp in df.groupby(['session_id', 'test_type']):
-        grp = grp.sort_values('pressed_at').reset_index(drop=True)
-        times = grp['pressed_at_ms'].values
-        evts = grp['event_type'].values
-        last_keyup_time = None
-        for i in range(len(grp)):
-            if evts[i] == 'keyup':
-                last_keyup_time = times[i]
-            elif evts[i] == 'keydown' and last_keyup_time is not None:
-                iki_ms = times[i] - last_keyup_time
-                if 0 < iki_ms < 5000:
-                    iki_list.append((sid, tt, iki_ms))
-                last_keyup_time = None
-
-    khd_df = pd.DataFrame({
-        'session_id': [x[0] for x in session_test],
-        'test_type': [x[1] for x in session_test],
-        'khd_ms': khd_list,
-        'key': key_list,
-    }) if khd_list else pd.DataFrame(columns=['session_id', 'test_type', 'khd_ms', 'key'])
-
-    iki_df = pd.DataFrame(
-        [{'session_id': x[0], 'test_type': x[1], 'iki_ms': x[2]} for x in iki_list]
-    ) if iki_list else pd.DataFrame(columns=['session_id', 'test_type', 'iki_ms'])
-
-    # --- Per test type (free, timed, multitasking) ---
-    agg = []
-    for (sid, tt), grp in df.groupby(['session_id', 'test_type']):
-        khd_s = khd_df[(khd_df['session_id'] == sid) & (khd_df['test_type'] == tt)]['khd_ms']
-        iki_s = iki_df[(iki_df['session_id'] == sid) & (iki_df['test_type'] == tt)]['iki_ms']
-        agg.append(_agg_row(sid, tt, grp, khd_s, iki_s))
-
-    # --- Overall per session_id (all tests in that session combined) ---
-    for sid in df['session_id'].unique():
-        grp_all = df[df['session_id'] == sid].sort_values('pressed_at').reset_index(drop=True)
-        keys = grp_all['key'].values
-        times = grp_all['pressed_at_ms'].values
-        evts = grp_all['event_type'].values
-        khd_overall = []
-        iki_overall = []
-        i = 0
-        while i < len(grp_all) - 1:
-            if evts[i] == 'keydown':
-                key = keys[i]
-                t_down = times[i]
-                j = i + 1
-                while j < len(grp_all):
-                    if evts[j] == 'keyup' and keys[j] == key:
-                        khd_ms = times[j] - t_down
-                        if 0 < khd_ms < 2000:
-                            khd_overall.append(khd_ms)
-                        break
-                    if evts[j] == 'keydown' and keys[j] == key:
-                        break
-                    j += 1
-            i += 1
-        last_keyup_time = None
-        for i in range(len(grp_all)):
-            if evts[i] == 'keyup':
-                last_keyup_time = times[i]
-            elif evts[i] == 'keydown' and last_keyup_time is not None:
-                iki_ms = times[i] - last_keyup_time
-                if 0 < iki_ms < 5000:
-                    iki_overall.append(iki_ms)
-                last_keyup_time = None
-        khd_s = pd.Series(khd_overall)
-        iki_s = pd.Series(iki_overall)
-        agg.append(_agg_row(sid, 'overall', grp_all, khd_s, iki_s))
-
-    return pd.DataFrame(agg)
+    if 'pressed_at_ms' not in df.columns:
+        df = df.assign(pressed_at_ms=df['pressed_at'].values.astype('datetime64[ms]').view('i8'))
+    # Scan events with a missing test_type as a test of their own (so _scan_by keeps them for the
+    # 'overall' roll-up); that group is left out of the per-test rows
+    test_type = df['test_type'].astype(object)
+    df = df.assign(test_type=test_type.where(test_type.notna(), _NO_TEST_TYPE))
+    df, khd_df, iki_df = _scan_by(df, ['session_id', 'test_type'])
+    per_test = _group_events(df)
+
+    # --- Overall per session_id: roll up the per-test totals and re-label the per-test KHD/IKI
+    # values by session; no pass over the raw events. Both row sets go into one DataFrame call ---
+    by_session = per_test.groupby('session_id', sort=False)
+    overall = by_session.agg(
+        n_events=('n_events', 'sum'),
+        n_keydowns=('n_keydowns', 'sum'),
+        backspace_count=('backspace_count', 'sum'),
+        t_min=('t_min', 'min'),
+        t_max=('t_max', 'max'),
+    ).reset_index().assign(test_type='overall')
+    session_of_group = by_session.ngroup().values
+    is_test = per_test['test_type'].values != _NO_TEST_TYPE
+    per_test_cols = {c: v[is_test] for c, v in _summarize_groups(per_test, khd_df, iki_df).items()}
+    overall_cols = _summarize_groups(
+        overall,
+        khd_df.assign(group_id=session_of_group[khd_df['group_id'].values]),
+        iki_df.assign(group_id=session_of_group[iki_df['group_id'].values]),
+    )
+    return pd.DataFrame({c: np.concatenate([per_test_cols[c], overall_cols[c]]) for c in per_test_cols})
 
 
 def compute_keystroke_metrics_by_field(df: pd.DataFrame) -> pd.DataFrame:
@@ -205,110 +406,112 @@ def compute_keystroke_metrics_by_field(df: pd.DataFrame) -> pd.DataFrame:
     # Ensure we have ms timestamps from CHUNK 1
     if "pressed_at_ms" not in df.columns:
         df = df.copy()
-        df["pressed_at_ms"] = df["pressed_at"].astype(np.int64) // 10**6
+        df["pressed_at_ms"] = df["pressed_at"].values.astype("datetime64[ms]").view("i8")
 
-    # Test-level start times so we can get "hesitation" before a given field starts
-    test_start_ms = (
-        df.groupby(["session_id", "test_type"])["pressed_at_ms"]
-        .min()
-        .to_dict()
+    # Test-level start times (over all events, with or without a field) for "hesitation" before a field starts
+    df = df.assign(
+        test_start_ms=df.groupby(["session_id", "test_type"], observed=True)["pressed_at_ms"].transform("min")
     )
 
-    rows = []
-    # Group by field/question within each session × test_type
-    for (sid, tt, field), grp in df.groupby(["session_id", "test_type", "field_name"]):
-        # Skip empty / missing field names
-        if pd.isna(field) or (isinstance(field, str) and field.strip() == ""):
-            continue
+    # Skip empty / missing field names
+    names = df["field_name"]
+    df = df[names.notna() & (names.astype(str).str.strip() != "")]
+    if df.empty:
+        print("No per-field metrics computed (no non-empty field_name values).")
+        return pd.DataFrame()
+
+    # Same scan and aggregation as compute_keystroke_metrics, one level finer. Per-field SDs
+    # have always been population SDs (ddof=0).
+    group_cols = ["session_id", "test_type", "field_name"]
+    df, khd_df, iki_df = _scan_by(df, group_cols)
+    return pd.DataFrame(_summarize_groups(_group_events(df, group_cols), khd_df, iki_df, keys=group_cols, ddof=0))
+
+
+def quantile_summary(df, by, cols):
+    """
+    p10 / mean / p90 and non-null count of each column in `cols` within each `by` group,
+    one row per (group, metric), for the CHUNK 6/7 summaries. NaNs are skipped; groups keep
+    first-seen order.
+    """
+    grouped = df.groupby(by, sort=False)[cols]
+    # One grouped (Cython) pass per statistic over all columns, instead of a Series call per cell
+    group_stats = {
+        'p10': grouped.quantile(0.10), 'mean': grouped.mean(),
+        'p90': grouped.quantile(0.90), 'n_rows': grouped.count(),
+    }
+    groups = group_stats['mean'].index.to_frame(index=False)
+    summary = groups.loc[groups.index.repeat(len(cols))].reset_index(drop=True)
+    summary['metric'] = np.tile(cols, len(groups))
+    for name, stat in group_stats.items():
+        summary[name] = stat.to_numpy().ravel()
+    return summary
 
-        grp = grp.sort_values("pressed_at").reset_index(drop=True)
-        times = grp["pressed_at_ms"].values
-        evts = grp["event_type"].values
-        keys = grp["key"].values
 
-        if len(grp) == 0:
+def _code_parts(code, namespace, seen):
+    """
+    Bytes identifying a code object: its bytecode and constants, then, recursively, the
+    module-level functions (numba-compiled ones via .py_func) and str/int/float constants it
+    refers to by name. Comments and formatting are not included.
+    """
+    yield code.co_code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _code_parts(const, namespace, seen)
+        elif isinstance(const, frozenset):  # set literals; repr order varies with string hashing
+            yield repr(sorted(map(repr, const))).encode()
+        else:
+            yield repr(const).encode()
+    for name in code.co_names:
+        if name in seen or name not in namespace:
             continue
+        seen.add(name)
+        obj = getattr(namespace[name], 'py_func', namespace[name])
+        if isinstance(obj, types.FunctionType):
+            yield from _code_parts(obj.__code__, namespace, seen)
+        elif isinstance(obj, (str, int, float)):
+            yield repr(obj).encode()
 
-        # Key-hold durations (KHD) within this field
-        khd_vals = []
-        i = 0
-        while i < len(grp) - 1:
-            if evts[i] == "keydown":
-                key = keys[i]
-                t_down = times[i]
-                j = i + 1
-                while j < len(grp):
-                    if evts[j] == "keyup" and keys[j] == key:
-                        khd_ms = times[j] - t_down
-                        if 0 < khd_ms < 2000:
-                            khd_vals.append(khd_ms)
-                        break
-                    if evts[j] == "keydown" and keys[j] == key:
-                        break
-                    j += 1
-            i += 1
-
-        # Inter-key intervals (IKI) within this field
-        iki_vals = []
-        last_keyup_time = None
-        for idx in range(len(grp)):
-            if evts[idx] == "keyup":
-                last_keyup_time = times[idx]
-            elif evts[idx] == "keydown" and last_keyup_time is not None:
-                iki_ms = times[idx] - last_keyup_time
-                if 0 < iki_ms < 5000:
-                    iki_vals.append(iki_ms)
-                last_keyup_time = None
-
-        duration_ms = times.max() - times.min() if len(times) >= 2 else 0
-        n_events = len(grp)
-        n_keydowns = (grp["event_type"] == "keydown").sum()
-        n_backspace = ((grp["event_type"] == "keydown") & (grp["key"] == "Backspace")).sum()
-
-        iki_arr = np.array(iki_vals) if len(iki_vals) else np.array([])
-
-        pause_200 = (iki_arr > 200).sum() if iki_arr.size else 0
-        pause_500 = (iki_arr > 500).sum() if iki_arr.size else 0
-
-        # Hesitation: how long after test start did this field see its first key?
-        test_start = test_start_ms.get((sid, tt), times.min())
-        first_key_latency_ms = times.min() - test_start
-
-        row = {
-            "session_id": sid,
-            "test_type": tt,
-            "field_name": field,
-            "n_events": n_events,
-            "n_keydowns": n_keydowns,
-            "duration_sec": duration_ms / 1000.0,
-            "mean_khd_ms": np.mean(khd_vals) if khd_vals else np.nan,
-            "sd_khd_ms": np.std(khd_vals) if khd_vals else np.nan,
-            "cv_khd": (np.std(khd_vals) / np.mean(khd_vals)) if khd_vals and np.mean(khd_vals) > 0 else np.nan,
-            "mean_iki_ms": iki_arr.mean() if iki_arr.size else np.nan,
-            "sd_iki_ms": iki_arr.std() if iki_arr.size else np.nan,
-            "cv_iki": (iki_arr.std() / iki_arr.mean()) if iki_arr.size and iki_arr.mean() > 0 else np.nan,
-            "pause_count_200ms": pause_200,
-            "pause_count_500ms": pause_500,
-            "backspace_count": n_backspace,
-            "backspace_rate": n_backspace / n_keydowns if n_keydowns else 0,
-            "cpm": (n_keydowns - n_backspace) / (duration_ms / 60000) if duration_ms > 0 else np.nan,
-            "first_key_latency_ms": first_key_latency_ms,
-        }
-        rows.append(row)
-
-    if not rows:
-        print("No per-field metrics computed (no non-empty field_name values).")
-        return pd.DataFrame()
 
-    return pd.DataFrame(rows)
+def _metrics_signature(compute, df):
+    """Cache key for compute(df): a hash of the metric code, df's columns/dtypes and df's contents."""
+    h = hashlib.sha256()
+    for part in _code_parts(compute.__code__, compute.__globals__, {compute.__name__}):
+        h.update(part)
+    h.update(repr([(c, str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(str(pd.util.hash_pandas_object(df, index=False).sum()).encode())
+    return h.hexdigest()
+
+
+def cached_metrics(compute, df, cache_file):
+    """
+    compute(df), reusing the Parquet copy in cache_file while the signature recorded in the
+    sidecar cache_file + '.meta' still matches, i.e. neither df's contents nor the metric code
+    (compute and the helpers it calls) have changed. Caching is best effort.
+    """
+    meta_file = cache_file + ".meta"
+    signature = _metrics_signature(compute, df)
+    if os.path.exists(cache_file) and os.path.exists(meta_file):
+        with open(meta_file) as f:
+            if f.read() == signature:
+                print(f"Loaded cached metrics from {cache_file} (delete it to recompute)")
+                return pd.read_parquet(cache_file)
+    result = compute(df)
+    try:
+        result.to_parquet(cache_file, index=False)
+    except (ImportError, ValueError, TypeError) as e:  # no Parquet engine, or a column it can't store
+        print(f"Not caching metrics to {cache_file}: {e}")
+        return result
+    with open(meta_file, "w") as f:
+        f.write(signature)
+    return result
 
 
 # Run metrics
-metrics_df = compute_keystroke_metrics(keystrokes)
+metrics_df = cached_metrics(compute_keystroke_metrics, keystrokes, METRICS_CACHE_FILE)
 print("Keystroke metrics (per session × test_type):")
 print(metrics_df.head(10))
 
-per_field_metrics_df = compute_keystroke_metrics_by_field(keystrokes)
+per_field_metrics_df = cached_metrics(compute_keystroke_metrics_by_field, keystrokes, PER_FIELD_METRICS_CACHE_FILE)
 if not per_field_metrics_df.empty:
     print("\nPer-field / per-question keystroke metrics (first 20 rows):")
     print(per_field_metrics_df.head(20))
@@ -332,6 +535,13 @@ if concentration_col and concentration_col in stress_sub.columns:
 elif 'concentration' not in stress_sub.columns:
     stress_sub['concentration'] = np.nan
 
+# One stress row per (session_id, test_type): keep the latest submission (by created_at when present)
+# so repeat submissions neither multiply merged rows nor double-count in the correlations
+if 'created_at' in stress.columns:
+    submitted = pd.to_datetime(stress['created_at'], format='ISO8601', utc=True, errors='coerce')
+    stress_sub = stress_sub.loc[submitted.sort_values(kind='stable', na_position='first').index]
+stress_sub = stress_sub.drop_duplicates(['session_id', 'test_type'], keep='last')
+
 # Left merge: keep all metrics (including test_type='overall'); stress cols are NaN for 'overall'
 merged = metrics_df.merge(
     stress_sub,
@@ -347,29 +557,47 @@ print(merged.head(12))
 # =============================================================================
 # CHUNK 3: CORRELATIONS (keystroke metrics vs stress/workload)
 # =============================================================================
-def safe_corr(x, y):
-    mask = ~(x.isna() | y.isna())
-    if mask.sum() < 3:
-        return np.nan, np.nan
-    r, p = stats.pearsonr(x[mask], y[mask])
-    return r, p
+def pairwise_corr(x, y):
+    """
+    Pearson r and two-sided p-value for every (y column, x column) pair, each over the rows where
+    both values are present (same as scipy.stats.pearsonr per pair; NaN if fewer than 3 rows).
+    All pairs come from a few masked matrix products instead of one pearsonr call per pair.
+    Returns (r, p) DataFrames with y columns as the index and x columns as the columns.
+    """
+    X = x.to_numpy(dtype=float)
+    Y = y.to_numpy(dtype=float)
+    mx = (~np.isnan(X)).astype(float)
+    my = (~np.isnan(Y)).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Centre each column first so the sums below don't lose precision
+        X = np.where(mx > 0, X - np.nansum(X, axis=0) / mx.sum(axis=0), 0.0)
+        Y = np.where(my > 0, Y - np.nansum(Y, axis=0) / my.sum(axis=0), 0.0)
+        n = my.T @ mx
+        sum_x, sum_y = my.T @ X, Y.T @ mx
+        var_x = n * (my.T @ X**2) - sum_x**2
+        var_y = n * ((Y**2).T @ mx) - sum_y**2
+        r = (n * (Y.T @ X) - sum_x * sum_y) / np.sqrt(var_x * var_y)
+        r = np.where((n >= 3) & (var_x > 0) & (var_y > 0), np.clip(r, -1, 1), np.nan)
+        t = r * np.sqrt((n - 2) / (1 - r**2))
+        p = 2 * stats.t.sf(np.abs(t), n - 2)
+    return (
+        pd.DataFrame(r, index=y.columns, columns=x.columns),
+        pd.DataFrame(p, index=y.columns, columns=x.columns),
+    )
 
 outcomes = [c for c in ['stress_level', 'mental_demand', 'rushed_feeling', 'rushed_feel', 'concentration', 'concentration_difficulty'] if c in merged.columns]
 outcomes = list(dict.fromkeys(outcomes))  # keep order, no dupes
 predictors = ['mean_iki_ms', 'sd_iki_ms', 'mean_khd_ms', 'sd_khd_ms', 'cv_iki', 'cv_khd', 'pause_count_500ms', 'backspace_rate', 'cpm']
+predictors = [c for c in predictors if c in merged.columns]
 
 # Correlations only for per-test rows (stress is reported per test, not for 'overall')
 merged_per_test = merged[merged['test_type'] != 'overall']
+corr_r, corr_p = pairwise_corr(merged_per_test[predictors], merged_per_test[outcomes])
 print("\n--- Correlations (r, p-value) with stress/workload [per-test only] ---")
 for out in outcomes:
-    if out not in merged_per_test.columns:
-        continue
     print(f"\n{out}:")
     for pred in predictors:
-        if pred not in merged_per_test.columns:
-            continue
-        r, p = safe_corr(merged_per_test[pred], merged_per_test[out])
-        print(f"  {pred}: r = {r:.3f}, p = {p:.4f}")
+        print(f"  {pred}: r = {corr_r.at[out, pred]:.3f}, p = {corr_p.at[out, pred]:.4f}")
 
 # --- END CHUNK 3. Requires CHUNK 1 and 2. ---
 
@@ -392,10 +620,9 @@ BEFORE INDIVIDUAL STATS, YOU GET:
 2) MERGED (keystroke metrics + stress)
    - What it is: metrics_df joined with stress_workload on (session_id, test_type). So each row
      has keystroke metrics + self-reported stress (stress_level, mental_demand, etc.) for that test.
-   - Duplicates: If you see the same (session_id, test_type) twice with different stress values,
-     it means that participant submitted the stress form more than once for that test (e.g. two
-     submissions). You may want to keep one per (session_id, test_type) (e.g. latest) to avoid
-     double-counting in correlations.
+   - Duplicates: If a participant submitted the stress form more than once for a test, CHUNK 2
+     keeps only the latest submission (by created_at) per (session_id, test_type), so each test
+     is counted once in the correlations.
    - What you can deduce: Which keystroke patterns co-occur with higher/lower stress (descriptive).
    - test_type='overall' rows have no stress (stress is per test); they’re for session-level
      keystroke summary only.
@@ -440,8 +667,9 @@ if MAX_SESSIONS_TO_PRINT is not None:
 print("\n" + "=" * 60)
 print("INDIVIDUAL STATS (by session_id → test_type → metrics)")
 print("=" * 60)
-for sid in session_ids:
-    sess = merged[merged['session_id'] == sid]
+# Partition the selected sessions in one pass (sort=False keeps first-seen session order and row order)
+selected = merged[merged['session_id'].isin(session_ids)]
+for sid, sess in selected.groupby('session_id', sort=False):
     # Show session total row once (short id)
     sid_short = str(sid)[:8] + "..." if len(str(sid)) > 8 else sid
     print(f"\nsession_id: {sid_short}")
@@ -475,25 +703,13 @@ numeric_metrics = [
 ]
 numeric_metrics = [c for c in numeric_metrics if c in metrics_df.columns]
 
-overall_stats = []
-for tt in metrics_df['test_type'].unique():
-    m = metrics_df[metrics_df['test_type'] == tt]
-    for col in numeric_metrics:
-        overall_stats.append({
-            'test_type': tt,
-            'metric': col,
-            'p10': m[col].quantile(0.10),
-            'mean': m[col].mean(),
-            'p90': m[col].quantile(0.90),
-        })
-
-overall_df = pd.DataFrame(overall_stats)
+overall_df = quantile_summary(metrics_df, 'test_type', numeric_metrics)
+test_counts = metrics_df.groupby('test_type', sort=False).size()
 print("\n" + "=" * 60)
 print("OVERALL STATS (by test_type: 10th %ile, mean, 90th %ile)")
 print("=" * 60)
-for tt in overall_df['test_type'].unique():
-    t = overall_df[overall_df['test_type'] == tt]
-    print(f"\n--- {tt} (n = {len(metrics_df[metrics_df['test_type'] == tt])} sessions) ---")
+for tt, t in overall_df.groupby('test_type', sort=False):
+    print(f"\n--- {tt} (n = {test_counts[tt]} sessions) ---")
     for _, row in t.iterrows():
         print(f"  {row['metric']}: p10 = {row['p10']:.2f}, mean = {row['mean']:.2f}, p90 = {row['p90']:.2f}")
 
@@ -517,24 +733,11 @@ if "per_field_metrics_df" in globals() and not per_field_metrics_df.empty:
     ]
     field_numeric_metrics = [c for c in field_numeric_metrics if c in per_field_metrics_df.columns]
 
-    field_stats_rows = []
-    for (tt, fname), grp in per_field_metrics_df.groupby(["test_type", "field_name"]):
-        for col in field_numeric_metrics:
-            vals = grp[col].dropna()
-            if vals.empty:
-                continue
-            field_stats_rows.append({
-                "test_type": tt,
-                "field_name": fname,
-                "metric": col,
-                "p10": vals.quantile(0.10),
-                "mean": vals.mean(),
-                "p90": vals.quantile(0.90),
-                "n_rows": len(vals),
-            })
-
-    if field_stats_rows:
-        field_stats_df = pd.DataFrame(field_stats_rows)
+    # Metrics with no values in a field are dropped
+    field_stats_df = quantile_summary(per_field_metrics_df, ["test_type", "field_name"], field_numeric_metrics)
+    field_stats_df = field_stats_df[field_stats_df["n_rows"] > 0]
+
+    if not field_stats_df.empty:
         print("\n" + "=" * 60)
         print("PER-FIELD / PER-QUESTION STATS (across all sessions)")
         print("=" * 60)